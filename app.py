@@ -1,11 +1,40 @@
 from __future__ import annotations
 
+from typing import Any
+
 from flask import Flask, jsonify, request, send_from_directory
+from flask.json.provider import DefaultJSONProvider
 
 from ma.demo01 import calc_ma_start_dates, parse_yyyymmddhh
 from ma.ma_trend import calc_ma_trend
 
+try:
+    import orjson
+except ImportError:  # 可选依赖，未安装时使用 Flask 默认的 json 编码
+    orjson = None
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    def _orjson_dumps(self, obj: Any) -> bytes:
+        # 沿用 DefaultJSONProvider.sort_keys，键顺序不随是否安装 orjson 而变化
+        option = orjson.OPT_SORT_KEYS if self.sort_keys else None
+        return orjson.dumps(obj, default=self.default, option=option)
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return self._orjson_dumps(obj).decode("utf-8")
+
+    def loads(self, s: str | bytes, **kwargs: Any) -> Any:
+        return orjson.loads(s)
+
+    def response(self, *args: Any, **kwargs: Any) -> object:
+        # orjson 直接输出 UTF-8 bytes，省去 str -> bytes 的再编码
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self._orjson_dumps(obj), mimetype=self.mimetype)
+
+
 app = Flask(__name__, static_folder="public", static_url_path="/public")
+if orjson is not None:
+    app.json = OrjsonProvider(app)
 
 
 @app.get("/")
@@ -49,19 +78,9 @@ def ma_trend() -> object:
     except (ValueError, FileNotFoundError) as exc:
         return jsonify({"error": str(exc)}), 400
 
-    return jsonify(
-        {
-            "input": result.input,
-            "latest_ts": result.latest_ts,
-            "prev_ts": result.prev_ts,
-            "ma30_latest": result.ma30_latest,
-            "ma30_prev": result.ma30_prev,
-            "ma30_trend": result.ma30_trend,
-            "ma60_latest": result.ma60_latest,
-            "ma60_prev": result.ma60_prev,
-            "ma60_trend": result.ma60_trend,
-        }
-    )
+    # MaTrendResult 字段即响应字段；vars() 直接取实例的 __dict__，
+    # 不逐字段构造 dict，也不经 dataclasses.asdict 的深拷贝
+    return jsonify(vars(result))
 
 
 if __name__ == "__main__":
@@ -1,11 +1,17 @@
 from __future__ import annotations
 
+import re
 import sys
 from dataclasses import dataclass
 from datetime import datetime, timedelta
 
 
 INPUT_FMT = "%Y%m%d%H"
+# 只接受 ASCII 数字；str.isdigit() 会放过全角数字等 Unicode 数字
+_TS_RE = re.compile(r"\A[0-9]{10}\Z")
+# 1h K线周期：MA30/MA60 需要 30/60 根K线，起始时间=结束时间- (N-1)小时
+_MA30_OFFSET = timedelta(hours=29)
+_MA60_OFFSET = timedelta(hours=59)
 
 
 @dataclass(frozen=True)
@@ -15,19 +21,26 @@ class MaStartDates:
 
 
 def parse_yyyymmddhh(value: str) -> datetime:
+    # 格式固定为 10 位数字，直接切片转 int，省去 strptime 每次解析格式串的开销
+    if not _TS_RE.match(value):
+        raise ValueError("输入格式错误，必须为YYYYMMDDhh，例如 2025012816")
     try:
-        return datetime.strptime(value, INPUT_FMT)
+        return datetime(
+            int(value[0:4]), int(value[4:6]), int(value[6:8]), int(value[8:10])
+        )
     except ValueError as exc:
         raise ValueError("输入格式错误，必须为YYYYMMDDhh，例如 2025012816") from exc
 
 
+def format_yyyymmddhh(dt: datetime) -> str:
+    # 等价于 dt.strftime(INPUT_FMT)，直接拼接字段避免格式串解析
+    return f"{dt.year:04d}{dt.month:02d}{dt.day:02d}{dt.hour:02d}"
+
+
 def calc_ma_start_dates(end_dt: datetime) -> MaStartDates:
-    # 1h K线周期：MA30/MA60 需要 30/60 根K线，起始时间=结束时间- (N-1)小时
-    ma30_start = end_dt - timedelta(hours=29)
-    ma60_start = end_dt - timedelta(hours=59)
     return MaStartDates(
-        ma30_start=ma30_start.strftime(INPUT_FMT),
-        ma60_start=ma60_start.strftime(INPUT_FMT),
+        ma30_start=format_yyyymmddhh(end_dt - _MA30_OFFSET),
+        ma60_start=format_yyyymmddhh(end_dt - _MA60_OFFSET),
     )
 
 
@@ -1,11 +1,13 @@
 from __future__ import annotations
 
 import csv
+from bisect import bisect_right
 from dataclasses import dataclass
 from datetime import datetime
+from functools import lru_cache
 from pathlib import Path
 
-from .demo01 import INPUT_FMT
+from .demo01 import format_yyyymmddhh, parse_yyyymmddhh
 
 
 @dataclass(frozen=True)
@@ -28,36 +30,48 @@ def _parse_float(value: str, field_name: str, row_index: int) -> float:
         raise ValueError(f"第 {row_index} 行 {field_name} 无法解析为数字。") from exc
 
 
-def load_ma_csv(csv_path: str) -> list[tuple[datetime, float, float]]:
+def load_ma_csv(csv_path: str) -> list[tuple[str, float, float]]:
     path = Path(csv_path).expanduser()
     if not path.exists():
         raise FileNotFoundError(f"CSV 文件不存在: {path}")
 
     with path.open(newline="", encoding="utf-8") as csvfile:
-        reader = csv.DictReader(csvfile)
-        required_fields = {"timestamp", "ma30", "ma60"}
-        if not reader.fieldnames:
+        reader = csv.reader(csvfile)
+        fieldnames = next(reader, None)
+        if not fieldnames:
             raise ValueError("CSV 文件缺少表头。")
-        missing_fields = required_fields - set(reader.fieldnames)
+        required_fields = {"timestamp", "ma30", "ma60"}
+        missing_fields = required_fields - set(fieldnames)
         if missing_fields:
             missing = ", ".join(sorted(missing_fields))
             raise ValueError(f"CSV 表头缺少字段: {missing}")
 
-        rows: list[tuple[datetime, float, float]] = []
+        # 表头只解析一次，数据行按列下标取值，避免逐行构造 dict
+        ts_i = fieldnames.index("timestamp")
+        ma30_i = fieldnames.index("ma30")
+        ma60_i = fieldnames.index("ma60")
+        min_len = max(ts_i, ma30_i, ma60_i) + 1
+
+        rows: list[tuple[str, float, float]] = []
         for row_index, row in enumerate(reader, start=2):
-            raw_ts = (row.get("timestamp") or "").strip()
+            if not row:
+                continue
+            if len(row) < min_len:
+                raise ValueError(f"第 {row_index} 行字段数量不足。")
+            raw_ts = row[ts_i].strip()
             if not raw_ts:
                 raise ValueError(f"第 {row_index} 行 timestamp 不能为空。")
+            # 只做校验，保留原始字符串：固定 10 位数字的字符串顺序即时间顺序
             try:
-                ts = datetime.strptime(raw_ts, INPUT_FMT)
+                parse_yyyymmddhh(raw_ts)
             except ValueError as exc:
                 raise ValueError(
                     f"第 {row_index} 行 timestamp 格式错误，应为 YYYYMMDDhh。"
                 ) from exc
 
-            ma30 = _parse_float((row.get("ma30") or "").strip(), "ma30", row_index)
-            ma60 = _parse_float((row.get("ma60") or "").strip(), "ma60", row_index)
-            rows.append((ts, ma30, ma60))
+            ma30 = _parse_float(row[ma30_i], "ma30", row_index)
+            ma60 = _parse_float(row[ma60_i], "ma60", row_index)
+            rows.append((raw_ts, ma30, ma60))
 
     if not rows:
         raise ValueError("CSV 文件没有数据行。")
@@ -66,6 +80,16 @@ def load_ma_csv(csv_path: str) -> list[tuple[datetime, float, float]]:
     return rows
 
 
+@lru_cache(maxsize=8)
+def _load_cached(
+    csv_path: str, mtime_ns: int, size: int
+) -> tuple[tuple[str, ...], tuple[float, ...], tuple[float, ...]]:
+    # mtime_ns/size 只参与缓存键：文件被改写后键变化，自动重新解析
+    # 按列缓存 (timestamp, ma30, ma60)，查询时二分后直接按下标取值
+    timestamps, ma30s, ma60s = zip(*load_ma_csv(csv_path))
+    return timestamps, ma30s, ma60s
+
+
 def _trend_label(latest: float, previous: float) -> str:
     if latest > previous:
         return "up"
@@ -75,23 +99,30 @@ def _trend_label(latest: float, previous: float) -> str:
 
 
 def calc_ma_trend(end_dt: datetime, csv_path: str) -> MaTrendResult:
-    rows = load_ma_csv(csv_path)
-    filtered = [item for item in rows if item[0] <= end_dt]
-    if len(filtered) < 2:
-        raise ValueError("CSV 数据不足，至少需要 2 条记录用于趋势判断。")
+    path = Path(csv_path).expanduser()
+    try:
+        stat = path.stat()
+    except FileNotFoundError as exc:
+        raise FileNotFoundError(f"CSV 文件不存在: {path}") from exc
 
-    latest = filtered[-1]
-    previous = filtered[-2]
+    timestamps, ma30s, ma60s = _load_cached(
+        str(path.resolve()), stat.st_mtime_ns, stat.st_size
+    )
+    # 时间列已升序，二分定位 end_dt 之后的第一条，取其前两条即可
+    end_ts = format_yyyymmddhh(end_dt)
+    idx = bisect_right(timestamps, end_ts)
+    if idx < 2:
+        raise ValueError("CSV 数据不足，至少需要 2 条记录用于趋势判断。")
 
-    ma30_latest = latest[1]
-    ma30_prev = previous[1]
-    ma60_latest = latest[2]
-    ma60_prev = previous[2]
+    ma30_latest = ma30s[idx - 1]
+    ma30_prev = ma30s[idx - 2]
+    ma60_latest = ma60s[idx - 1]
+    ma60_prev = ma60s[idx - 2]
 
     return MaTrendResult(
-        input=end_dt.strftime(INPUT_FMT),
-        latest_ts=latest[0].strftime(INPUT_FMT),
-        prev_ts=previous[0].strftime(INPUT_FMT),
+        input=end_ts,
+        latest_ts=timestamps[idx - 1],
+        prev_ts=timestamps[idx - 2],
         ma30_latest=ma30_latest,
         ma30_prev=ma30_prev,
         ma30_trend=_trend_label(ma30_latest, ma30_prev),
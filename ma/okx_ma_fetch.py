@@ -2,15 +2,27 @@ from __future__ import annotations
 
 import argparse
 import csv
+import http.client
 import json
+import math
 import ssl
+import threading
 import time
+from bisect import bisect_left
 from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime, timedelta, timezone
-from typing import Iterable
-from urllib.parse import urlencode
-from urllib.request import Request, urlopen
-from urllib.error import URLError
+from functools import lru_cache, partial
+from itertools import chain
+from typing import Iterable, Iterator
+from urllib.parse import urlencode, urlsplit
+from urllib.request import Request, getproxies, proxy_bypass, urlopen
+
+try:
+    import orjson
+except ImportError:  # 可选依赖，未安装时使用标准库 json
+    orjson = None
 
 
 DEFAULT_BASE_URL = "https://www.okx.com"
@@ -22,10 +34,37 @@ MAX_LIMIT = 100
 TIMEOUT_SECONDS = 10
 DEFAULT_RETRIES = 3
 RETRY_BACKOFF_SECONDS = 1.5
-OUTPUT_FMT = "%Y%m%d%H"
-
-
+DEFAULT_WORKERS = 8
+# OKX history-candles 限频：每个 IP 每 2 秒最多 20 次请求
+RATE_LIMIT_REQUESTS = 20
+RATE_LIMIT_SECONDS = 2.0
+# 按 UTC 整点对齐的 K 线周期（毫秒），可预先计算分页窗口并发拉取
+BAR_MS = {
+    "1m": 60_000,
+    "5m": 300_000,
+    "15m": 900_000,
+    "30m": 1_800_000,
+    "1H": 3_600_000,
+    "4H": 14_400_000,
+}
+USER_AGENT = "trader_tools"
+
+# 每个线程各自持有的长连接，键为 (base_url, timeout, insecure)；
+# 同时登记到 _open_connections，拉取结束后由 _close_connections 统一关闭
+_local = threading.local()
+_open_connections: list[http.client.HTTPConnection] = []
+_open_connections_lock = threading.Lock()
+
+
+def _json_loads(raw: bytes) -> dict:
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+@lru_cache(maxsize=2)
 def _build_ssl_context(insecure: bool) -> ssl.SSLContext:
+    # 加载系统 CA 证书开销较大，同一配置只创建一次，各请求/线程共用
     if insecure:
         return ssl._create_unverified_context()
     context = ssl.create_default_context()
@@ -41,6 +80,83 @@ def _build_opener(proxy: str | None, context: ssl.SSLContext):
     return build_opener(ProxyHandler({"http": proxy, "https": proxy}), HTTPSHandler(context=context))
 
 
+def _uses_proxy(base_url: str, proxy: str | None) -> bool:
+    if proxy:
+        return True
+    parts = urlsplit(base_url)
+    return parts.scheme in getproxies() and not proxy_bypass(parts.hostname or "")
+
+
+def _get_connection(base_url: str, timeout: int, insecure: bool) -> http.client.HTTPConnection:
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    key = (base_url, timeout, insecure)
+    conn = connections.get(key)
+    if conn is None:
+        parts = urlsplit(base_url)
+        if parts.scheme == "https":
+            conn = http.client.HTTPSConnection(
+                parts.hostname,
+                parts.port,
+                timeout=timeout,
+                context=_build_ssl_context(insecure),
+            )
+        else:
+            conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=timeout)
+        connections[key] = conn
+        with _open_connections_lock:
+            _open_connections.append(conn)
+    return conn
+
+
+def _close_connections() -> None:
+    # 关闭已登记的长连接；当前线程的缓存一并清空，之后的请求会重新建立连接
+    with _open_connections_lock:
+        connections = _open_connections[:]
+        _open_connections.clear()
+    for conn in connections:
+        conn.close()
+    _local.connections = {}
+
+
+def _keepalive_get(base_url: str, query: str, timeout: int, insecure: bool) -> bytes:
+    # 复用同一条 HTTP/1.1 连接，分页请求不必每次重新建立 TCP/TLS
+    conn = _get_connection(base_url, timeout, insecure)
+    path = f"{urlsplit(base_url).path.rstrip('/')}{ENDPOINT}?{query}"
+    headers = {"User-Agent": USER_AGENT}
+    reused = conn.sock is not None
+    try:
+        try:
+            conn.request("GET", path, headers=headers)
+            response = conn.getresponse()
+        except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+            if not reused:
+                raise
+            # 复用的空闲连接可能已被服务端关闭：在新连接上立即重发一次，不占用重试次数
+            conn.close()
+            conn.request("GET", path, headers=headers)
+            response = conn.getresponse()
+        body = response.read()
+    except (OSError, http.client.HTTPException):
+        # 连接状态未知，关闭后下次请求会自动重连
+        conn.close()
+        raise
+    status = response.status
+    if 300 <= status < 400:
+        # 不跟随重定向：OKX 接口地址固定，出现重定向多半是 --base-url 配置有误
+        location = response.getheader("Location") or "未知地址"
+        raise RuntimeError(
+            f"OKX API 返回重定向 (HTTP {status}) 至 {location}，请检查 --base-url 是否正确。"
+        )
+    if 400 <= status < 500 and status != 429:
+        # 请求本身有误，重试无意义；429 限频与 5xx 仍交给重试
+        raise RuntimeError(f"OKX API 请求失败: HTTP {status} {response.reason}")
+    if status != 200:
+        raise http.client.HTTPException(f"HTTP {status} {response.reason}")
+    return body
+
+
 def _okx_get(
     params: dict[str, str],
     timeout: int,
@@ -49,22 +165,29 @@ def _okx_get(
     proxy: str | None,
     insecure: bool,
 ) -> list[list[str]]:
-    url = f"{base_url}{ENDPOINT}?{urlencode(params)}"
-    request = Request(url, headers={"User-Agent": "trader_tools"})
-    context = _build_ssl_context(insecure)
-    opener = _build_opener(proxy, context)
+    query = urlencode(params)
+    # 配置了代理（参数或环境变量）时仍走 urllib，由其处理代理与认证
+    use_proxy = _uses_proxy(base_url, proxy)
+    if use_proxy:
+        request = Request(f"{base_url}{ENDPOINT}?{query}", headers={"User-Agent": USER_AGENT})
+        context = _build_ssl_context(insecure)
+        opener = _build_opener(proxy, context)
 
     last_error: Exception | None = None
     for attempt in range(1, retries + 1):
         try:
-            if opener:
-                response = opener.open(request, timeout=timeout)
+            if not use_proxy:
+                raw = _keepalive_get(base_url, query, timeout, insecure)
             else:
-                response = urlopen(request, timeout=timeout, context=context)
-            with response:
-                payload = json.loads(response.read().decode("utf-8"))
+                if opener:
+                    response = opener.open(request, timeout=timeout)
+                else:
+                    response = urlopen(request, timeout=timeout, context=context)
+                with response:
+                    raw = response.read()
+            payload = _json_loads(raw)
             break
-        except (URLError, ssl.SSLError, TimeoutError) as exc:
+        except (OSError, http.client.HTTPException) as exc:
             last_error = exc
             if attempt == retries:
                 raise RuntimeError(
@@ -86,120 +209,245 @@ def _okx_get(
     return data
 
 
-def fetch_candles(
+# 任意 period 秒内最多 limit 个请求，供并发拉取的各线程共用。
+# 名额从发出请求起占用，直到收到响应后再保留 period 秒：按发出时间计数时，
+# 网络抖动会让请求在服务端扎堆到达；按响应时间计数则服务端看到的请求数不会超限
+class _RateLimiter:
+    def __init__(self, limit: int, period: float) -> None:
+        self._limit = limit
+        self._period = period
+        self._in_flight = 0
+        self._finished: deque[float] = deque()
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                while self._finished and now - self._finished[0] >= self._period:
+                    self._finished.popleft()
+                if self._in_flight + len(self._finished) < self._limit:
+                    break
+                timeout = None
+                if self._finished:
+                    timeout = self._finished[0] + self._period - now
+                self._cond.wait(timeout)
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                self._finished.append(time.monotonic())
+                self._cond.notify_all()
+
+
+def _fetch_candles_concurrent(
     inst_id: str,
     bar: str,
+    bar_ms: int,
     start_ms: int,
-    verbose: bool = False,
-    max_batches: int = 200,
-    timeout: int = TIMEOUT_SECONDS,
-    retries: int = DEFAULT_RETRIES,
-    base_url: str = DEFAULT_BASE_URL,
-    proxy: str | None = None,
-    insecure: bool = False,
-) -> list[list[str]]:
-    candles: list[list[str]] = []
-    before: int | None = None
-    after: int | None = None
-    paging_mode = "before"
-    last_oldest: int | None = None
-    batches = 0
-
-    while True:
-        batches += 1
-        if batches > max_batches:
-            raise RuntimeError("分页次数过多，可能遇到接口异常。请稍后重试。")
+    verbose: bool,
+    max_batches: int,
+    workers: int,
+    get,
+) -> tuple[list[int], list[float]] | None:
+    # 每个窗口用 after=窗口上界 拉取 MAX_LIMIT 根K线，窗口边界可预先算出，无需等待上一页
+    span = MAX_LIMIT * bar_ms
+    upper = (int(time.time() * 1000) // bar_ms + 1) * bar_ms
+    window_count = -(-(upper - start_ms) // span)
+    if window_count > max_batches:
+        raise RuntimeError("分页次数过多，可能遇到接口异常。请稍后重试。")
+
+    limiter = _RateLimiter(RATE_LIMIT_REQUESTS, RATE_LIMIT_SECONDS)
+
+    def fetch_window(after: int) -> list[list[str]]:
         params = {
             "instId": inst_id,
             "bar": bar,
             "limit": str(MAX_LIMIT),
+            "after": str(after),
         }
-        if paging_mode == "before" and before is not None:
-            params["before"] = str(before)
-        if paging_mode == "after" and after is not None:
-            params["after"] = str(after)
-
-        batch = _okx_get(
-            params,
-            timeout=timeout,
-            retries=retries,
-            base_url=base_url,
-            proxy=proxy,
-            insecure=insecure,
-        )
+        lower = after - span
+        with limiter.slot():
+            batch = get(params)
+        return [item for item in batch if lower <= int(item[0]) < after]
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            batches = list(
+                executor.map(fetch_window, [upper - k * span for k in range(window_count)])
+            )
+    finally:
+        # 工作线程随线程池退出，其线程内的长连接需在此关闭
+        _close_connections()
+
+    timestamps: list[int] = []
+    closes: list[float] = []
+    seen_empty = False
+    for index, batch in enumerate(batches, start=1):
         if not batch:
-            break
-
-        candles.extend(batch)
-        oldest_ts = int(batch[-1][0])
+            seen_empty = True
+            continue
+        # 较新的窗口为空而更早的窗口有数据，说明分页出现断档
+        if seen_empty:
+            return None
+        timestamps.extend(int(item[0]) for item in batch)
+        closes.extend(float(item[4]) for item in batch)
         if verbose:
-            oldest_fmt = _format_ts(oldest_ts)
             newest_fmt = _format_ts(int(batch[0][0]))
-            print(f"批次 {batches}({paging_mode}): {newest_fmt} -> {oldest_fmt}")
-        if last_oldest is not None and oldest_ts >= last_oldest:
-            if paging_mode == "before":
-                if verbose:
-                    print("检测到重复分页，切换为 after 模式继续分页。")
-                paging_mode = "after"
-                after = oldest_ts
-                last_oldest = None
-                continue
-            raise RuntimeError("分页未推进，OKX 返回重复数据。请稍后重试。")
-        last_oldest = oldest_ts
-        if oldest_ts <= start_ms:
-            break
-        if paging_mode == "before":
-            before = oldest_ts - 1
-        else:
-            after = oldest_ts
+            oldest_fmt = _format_ts(int(batch[-1][0]))
+            print(f"批次 {index}(并发): {newest_fmt} -> {oldest_fmt}")
 
-    return candles
+    return timestamps, closes
 
 
-def _rolling_mean(values: Iterable[tuple[int, float]], window: int) -> dict[int, float]:
-    queue: deque[float] = deque()
-    running_sum = 0.0
-    results: dict[int, float] = {}
-
-    for ts, value in values:
-        queue.append(value)
-        running_sum += value
-        if len(queue) > window:
-            running_sum -= queue.popleft()
-        if len(queue) == window:
-            results[ts] = running_sum / window
+def fetch_candles(
+    inst_id: str,
+    bar: str,
+    start_ms: int,
+    verbose: bool = False,
+    max_batches: int = 200,
+    timeout: int = TIMEOUT_SECONDS,
+    retries: int = DEFAULT_RETRIES,
+    base_url: str = DEFAULT_BASE_URL,
+    proxy: str | None = None,
+    insecure: bool = False,
+    workers: int = DEFAULT_WORKERS,
+) -> tuple[list[int], list[float]]:
+    try:
+        bar_ms = BAR_MS.get(bar)
+        if bar_ms is not None and workers > 1:
+            get = partial(
+                _okx_get,
+                timeout=timeout,
+                retries=retries,
+                base_url=base_url,
+                proxy=proxy,
+                insecure=insecure,
+            )
+            result = _fetch_candles_concurrent(
+                inst_id, bar, bar_ms, start_ms, verbose, max_batches, workers, get
+            )
+            if result is not None:
+                return result
+            if verbose:
+                print("并发分页结果存在断档，改为顺序分页。")
+
+        # 只保留时间戳与收盘价两列，不持有整批原始字符串数据
+        timestamps: list[int] = []
+        closes: list[float] = []
+        before: int | None = None
+        after: int | None = None
+        paging_mode = "before"
+        last_oldest: int | None = None
+        batches = 0
+
+        while True:
+            batches += 1
+            if batches > max_batches:
+                raise RuntimeError("分页次数过多，可能遇到接口异常。请稍后重试。")
+            params = {
+                "instId": inst_id,
+                "bar": bar,
+                "limit": str(MAX_LIMIT),
+            }
+            if paging_mode == "before" and before is not None:
+                params["before"] = str(before)
+            if paging_mode == "after" and after is not None:
+                params["after"] = str(after)
+
+            batch = _okx_get(
+                params,
+                timeout=timeout,
+                retries=retries,
+                base_url=base_url,
+                proxy=proxy,
+                insecure=insecure,
+            )
+            if not batch:
+                break
+
+            oldest_ts = int(batch[-1][0])
+            if verbose:
+                oldest_fmt = _format_ts(oldest_ts)
+                newest_fmt = _format_ts(int(batch[0][0]))
+                print(f"批次 {batches}({paging_mode}): {newest_fmt} -> {oldest_fmt}")
+            if last_oldest is not None and oldest_ts >= last_oldest:
+                if paging_mode == "before":
+                    if verbose:
+                        print("检测到重复分页，切换为 after 模式继续分页。")
+                    # 重复的这一批已在上一页取到，不再重复写入
+                    paging_mode = "after"
+                    after = oldest_ts
+                    last_oldest = None
+                    continue
+                raise RuntimeError("分页未推进，OKX 返回重复数据。请稍后重试。")
+            timestamps.extend(int(item[0]) for item in batch)
+            closes.extend(float(item[4]) for item in batch)
+            last_oldest = oldest_ts
+            if oldest_ts <= start_ms:
+                break
+            if paging_mode == "before":
+                before = oldest_ts - 1
+            else:
+                after = oldest_ts
 
+        return timestamps, closes
+    finally:
+        _close_connections()
+
+
+def _rolling_mean(values: list[float], window: int) -> list[float]:
+    # 滑动窗口：每步加入新值、减去移出窗口的旧值，结果与 values[window - 1:] 逐一对齐。
+    # 首个窗口用 math.fsum 精确求和，避免初始舍入误差带入后续每一步
+    if len(values) < window:
+        return []
+    running_sum = math.fsum(values[:window])
+    results = [running_sum / window]
+    for new, old in zip(values[window:], values):
+        running_sum += new - old
+        results.append(running_sum / window)
     return results
 
 
 def _format_ts(ts_ms: int) -> str:
-    dt = datetime.fromtimestamp(ts_ms / 1000, tz=timezone.utc)
-    return dt.strftime(OUTPUT_FMT)
-
-
-def build_rows(candles: list[list[str]], start_ms: int) -> list[tuple[str, float, float]]:
-    parsed = [(int(item[0]), float(item[4])) for item in candles]
-    parsed.sort(key=lambda item: item[0])
-
-    ma30 = _rolling_mean(parsed, 30)
-    ma60 = _rolling_mean(parsed, 60)
-
-    rows: list[tuple[str, float, float]] = []
-    for ts, _ in parsed:
-        if ts < start_ms:
-            continue
-        if ts not in ma30 or ts not in ma60:
-            continue
-        rows.append((_format_ts(ts), ma30[ts], ma60[ts]))
-
-    return rows
-
-
-def write_csv(rows: list[tuple[str, float, float]], output_path: str) -> None:
+    # 输出 UTC 时间的 YYYYMMDDhh，直接拼接 gmtime 字段，不经 strftime 解析格式串
+    tm = time.gmtime(ts_ms // 1000)
+    return f"{tm.tm_year:04d}{tm.tm_mon:02d}{tm.tm_mday:02d}{tm.tm_hour:02d}"
+
+
+def build_rows(
+    timestamps: list[int], closes: list[float], start_ms: int
+) -> Iterator[tuple[str, float, float]]:
+    # 分页结果按时间倒序返回，按时间戳升序重排两列
+    order = sorted(range(len(timestamps)), key=timestamps.__getitem__)
+    timestamps = [timestamps[i] for i in order]
+    closes = [closes[i] for i in order]
+
+    # MA60 从第 60 根 K 线起才有值，MA30 跳过前 30 个结果即与之对齐到同一时间轴
+    aligned_ts = timestamps[59:]
+    ma30 = _rolling_mean(closes, 30)[30:]
+    ma60 = _rolling_mean(closes, 60)
+    start_idx = bisect_left(aligned_ts, start_ms)
+
+    # 逐行生成，写 CSV 时边格式化边写出，不再整体构造输出列表
+    for ts, ma30_value, ma60_value in zip(
+        aligned_ts[start_idx:], ma30[start_idx:], ma60[start_idx:]
+    ):
+        yield _format_ts(ts), ma30_value, ma60_value
+
+
+def write_csv(rows: Iterable[tuple[str, float, float]], output_path: str) -> int:
+    written = 0
     with open(output_path, "w", newline="", encoding="utf-8") as csvfile:
         writer = csv.writer(csvfile)
         writer.writerow(["timestamp", "ma30", "ma60"])
-        writer.writerows(rows)
+        for row in rows:
+            writer.writerow(row)
+            written += 1
+    return written
 
 
 def parse_args() -> argparse.Namespace:
@@ -254,6 +502,12 @@ def parse_args() -> argparse.Namespace:
         action="store_true",
         help="跳过 SSL 证书验证（不推荐，仅用于排查 SSL 问题）",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help="并发请求数，默认 8；设为 1 则逐页顺序拉取",
+    )
     return parser.parse_args()
 
 
@@ -263,7 +517,7 @@ def main() -> int:
     target_start = now - timedelta(days=args.days)
     start_for_ma = target_start - timedelta(hours=59)
 
-    candles = fetch_candles(
+    timestamps, closes = fetch_candles(
         inst_id=args.inst_id,
         bar=DEFAULT_BAR,
         start_ms=int(start_for_ma.timestamp() * 1000),
@@ -273,17 +527,19 @@ def main() -> int:
         base_url=args.base_url,
         proxy=args.proxy,
         insecure=args.insecure,
+        workers=args.workers,
     )
 
-    if not candles:
+    if not timestamps:
         raise RuntimeError("未能获取到任何 K 线数据。")
 
-    rows = build_rows(candles, start_ms=int(target_start.timestamp() * 1000))
-    if not rows:
+    rows = build_rows(timestamps, closes, start_ms=int(target_start.timestamp() * 1000))
+    first_row = next(rows, None)
+    if first_row is None:
         raise RuntimeError("数据不足，无法计算 MA30/MA60。")
 
-    write_csv(rows, args.output)
-    print(f"已写入 {len(rows)} 行数据到 {args.output}")
+    written = write_csv(chain([first_row], rows), args.output)
+    print(f"已写入 {written} 行数据到 {args.output}")
     return 0
 
 